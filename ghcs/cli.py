@@ -1,8 +1,9 @@
 import argparse
 import os
 import dotenv
-from ghcs.search import search_github
-from ghcs.downloader import download_file
+from ghcs.search import search_github, extract_fragments
+from ghcs.downloader import download_file, save_fragments, archive_key, group_by_repository, download_repo_archive
+from ghcs.dedup import dedupe_by_sha, collapse_near_duplicates
 
 dotenv.load_dotenv()
 
@@ -21,6 +22,13 @@ def main():
     parser.add_argument("-r", "--remark", help="Description of what should be extracted from the downloaded files.")
     parser.add_argument("-o", "--output-file", help="Output file to save the extracted code (default: print to console).")
     parser.add_argument("-e", "--extensions", help="Comma-separated list of file extensions to consider for extraction (e.g., .py,.js)")
+    parser.add_argument("-f", "--fragments", action="store_true", help="Use matched fragments instead of whole files where available.")
+    parser.add_argument("-b", "--bulk-threshold", type=int, default=0, help="Fetch a repository archive instead of single files once this many hits share a repository and commit (default: 0, disabled).")
+    parser.add_argument("-wt", "--whole-tree", action="store_true", help="Extract the whole repository tree when an archive is fetched.")
+    parser.add_argument("-nd", "--no-dedup", action="store_true", help="Keep duplicate and near-duplicate hits instead of collapsing them.")
+    parser.add_argument("-sd", "--similarity-distance", type=int, default=3, help="Maximum SimHash bit distance for downloaded files to count as near-duplicates.")
+    parser.add_argument("-rf", "--remark-fragments", action="store_true", help="With --fragments, feed matched fragments instead of whole files to --remark extraction.")
+    parser.add_argument("-fc", "--fragment-context", type=int, help="Lines of context to keep around each match in a fragment (default: whole fragment).")
 
     args = parser.parse_args()
     token = args.token or os.getenv("GITHUB_TOKEN")
@@ -44,6 +52,8 @@ def main():
         print(f"Download: {args.download}")
         print(f"Download Directory: {args.download_dir}")
         print(f"Verbose: {args.verbose}")
+        print(f"Fragments: {args.fragments}")
+        print(f"Bulk Threshold: {args.bulk_threshold}")
         if args.remark:
             print(f"Extraction remark: {args.remark}")
     
@@ -56,28 +66,97 @@ def main():
         max_results=args.max_results,
         token=token,
         verbose=verbose,
+        text_match=args.fragments,
     )
 
     print(f"Found {len(results)} matching files.")
+
+    if not args.no_dedup:
+        unique_results = dedupe_by_sha(results, verbose=verbose)
+        if len(unique_results) < len(results):
+            print(f"Collapsed {len(results) - len(unique_results)} identical copies, {len(unique_results)} unique files remain.")
+        results = unique_results
     
-    # Keep track of whether we downloaded any files
-    downloaded_any = False
+    # Keep track of which files we downloaded, and how many identical copies each one stands for
+    saved_paths = []
+    copy_counts = {}
+    # Files that need a full download, fetched once the search results are grouped by repository
+    pending = []
     
     for item in results:
         file_url = item["html_url"].replace("github.com", "raw.githubusercontent.com").replace("/blob/", "/")
         file_path = item["path"]
+        fragments = extract_fragments(item, args.fragment_context) if args.fragments else []
+        # Partial files would be passed off as whole ones to the extractor unless the user asks for that
+        use_fragments = fragments and (not args.remark or args.remark_fragments)
 
-        if args.download:
+        if args.download and use_fragments:
             if verbose:
-                print(f"Downloading: {file_url}")
-            save_path = download_file(file_url, file_path, token, args.download_dir)
+                print(f"Saving {len(fragments)} fragment(s) for: {file_path}")
+            save_path = save_fragments(fragments, file_path, args.download_dir)
             if save_path:
-                downloaded_any = True
+                saved_paths.append(save_path)
+                copy_counts[save_path] = item.get("alias_count", 0)
+        elif args.download:
+            pending.append((file_url, file_path, item))
+            copy_counts[os.path.join(args.download_dir, file_path)] = item.get("alias_count", 0)
         else:
+            aliases = f" (+{item['alias_count']} identical copies)" if item.get("alias_count") else ""
             if verbose:
-                print(f"Matched file: {file_path}\n(URL: {file_url})")
+                print(f"Matched file: {file_path}{aliases}\n(URL: {file_url})")
             else:
-                print(f"Matched file: {file_path}")
+                print(f"Matched file: {file_path}{aliases}")
+            for fragment in fragments:
+                print("-" * 80)
+                print(fragment)
+
+    fetched = set()
+    if pending and args.bulk_threshold > 0:
+        groups = group_by_repository(item for _, _, item in pending)
+        for (full_name, ref), paths in groups.items():
+            if len(paths) < args.bulk_threshold:
+                continue
+            if verbose:
+                print(f"Fetching {len(paths)} files from {full_name}@{ref} as one archive")
+            extracted = download_repo_archive(full_name, ref, paths, token, args.download_dir, args.whole_tree, verbose)
+            if extracted:
+                saved_paths.extend(os.path.join(args.download_dir, path) for path in extracted)
+                fetched.update((full_name, ref, path) for path in extracted)
+
+    for file_url, file_path, item in pending:
+        if (*archive_key(item), file_path) in fetched:
+            continue
+        if verbose:
+            print(f"Downloading: {file_url}")
+        save_path = download_file(file_url, file_path, token, args.download_dir)
+        if save_path:
+            saved_paths.append(save_path)
+
+    # Parse extensions if provided
+    file_extensions = None
+    if args.extensions:
+        file_extensions = args.extensions.split(',')
+        if verbose:
+            print(f"Filtering files by extensions: {file_extensions}")
+
+    # Near-duplicates stay on disk; they are only kept out of the extraction prompt
+    aliases = {}
+    if saved_paths and not args.no_dedup:
+        from ghcs.extractor import DEFAULT_EXTENSIONS, MAX_FILE_SIZE
+
+        aliases = collapse_near_duplicates(
+            saved_paths,
+            args.similarity_distance,
+            file_extensions=file_extensions or DEFAULT_EXTENSIONS,
+            max_file_size=MAX_FILE_SIZE,
+            verbose=verbose,
+        )
+        for alias_path, rep_path in aliases.items():
+            copy_counts[rep_path] = copy_counts.get(rep_path, 0) + 1 + copy_counts.get(alias_path, 0)
+        for rep_path in dict.fromkeys(aliases.values()):
+            print(f"Kept {rep_path} as representative of {copy_counts[rep_path]} duplicate file(s).")
+
+    downloaded_any = bool(saved_paths)
     
     # Process extraction with Gemini if remark is provided and files were downloaded
     print(args.remark), print(args.download), print(downloaded_any)
@@ -85,22 +164,22 @@ def main():
         if verbose:
             print(f"Extracting code based on remark: '{args.remark}'")
         
-        # Parse extensions if provided
-        file_extensions = None
-        if args.extensions:
-            file_extensions = args.extensions.split(',')
-            if verbose:
-                print(f"Filtering files by extensions: {file_extensions}")
-        
         from ghcs.extractor import extract_code_with_gemini, convert_nb_to_python
         
         convert_nb_to_python(args.download_dir, verbose=verbose)
+        prompt_stats = {}
         extracted_code = extract_code_with_gemini(
             args.download_dir, 
             args.remark, 
             verbose=verbose,
-            file_extensions=file_extensions
+            file_extensions=file_extensions,
+            exclude=set(aliases),
+            copy_counts={path: count for path, count in copy_counts.items() if count and path not in aliases},
+            stats=prompt_stats,
         )
+        if prompt_stats:
+            print(f"Prompt: {prompt_stats['files_included']} of {prompt_stats['files_found']} files, "
+                  f"{prompt_stats['prompt_chars']} characters, peak {prompt_stats['peak_memory_bytes'] / 1_000_000:.2f}MB while building.")
         
         if args.output_file:
             with open(args.output_file, 'w', encoding='utf-8') as f:
@@ -0,0 +1,66 @@
+import hashlib
+import os
+import re
+
+SIMHASH_BITS = 64
+
+def dedupe_by_sha(results, verbose=False):
+    unique = {}
+    for item in results:
+        key = item.get("sha") or item["html_url"]
+        if key in unique:
+            unique[key]["alias_count"] = unique[key].get("alias_count", 0) + 1
+            if verbose:
+                print(f"Skipping identical copy of {unique[key]['path']}: {item['html_url']}")
+            continue
+        unique[key] = item
+    return list(unique.values())
+
+def simhash(text, shingle_size=3):
+    tokens = re.findall(r"\w+", text)
+    if len(tokens) < shingle_size:
+        shingles = {" ".join(tokens)}
+    else:
+        shingles = {" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)}
+
+    # Count set bits per position column-wise instead of looping over 64 bits for every shingle
+    bit_strings = [
+        format(int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big"), "064b")
+        for shingle in shingles
+    ]
+    half = len(bit_strings) / 2
+    fingerprint = 0
+    for column in zip(*bit_strings):
+        fingerprint = fingerprint << 1 | (column.count("1") > half)
+    return fingerprint
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+def collapse_near_duplicates(file_paths, max_distance=3, file_extensions=None, max_file_size=1_000_000, verbose=False):
+    representatives = []  # (fingerprint, path)
+    aliases = {}
+
+    for file_path in dict.fromkeys(file_paths):
+        if file_extensions and not any(file_path.endswith(ext) for ext in file_extensions):
+            continue
+        try:
+            if os.path.getsize(file_path) > max_file_size:
+                continue
+            with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                fingerprint = simhash(f.read())
+        except Exception as e:
+            if verbose:
+                print(f"Error fingerprinting file {file_path}: {e}")
+            continue
+
+        for rep_fingerprint, rep_path in representatives:
+            if hamming_distance(fingerprint, rep_fingerprint) <= max_distance:
+                aliases[file_path] = rep_path
+                if verbose:
+                    print(f"Found near-duplicate of {rep_path}: {file_path}")
+                break
+        else:
+            representatives.append((fingerprint, file_path))
+
+    return aliases
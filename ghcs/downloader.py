@@ -1,5 +1,8 @@
 import requests
 import os
+import tarfile
+
+GITHUB_ARCHIVE_URL = "https://api.github.com/repos/{full_name}/tarball/{ref}"
 
 def download_file(url, path, token=None, download_dir="codes"):
     try:
@@ -20,4 +23,83 @@ def download_file(url, path, token=None, download_dir="codes"):
     except Exception as e:
         print(f"Error: {e}")
         print(f"Failed to download {url}")
-        return None
\ No newline at end of file
+        return None
+
+def fragments_path(path):
+    # Keep the extension so extension filters still match, but never reuse the real file name
+    root, ext = os.path.splitext(path)
+    return f"{root}.fragments{ext}"
+
+
+def save_fragments(fragments, path, download_dir="codes"):
+    try:
+        save_path = os.path.join(download_dir, fragments_path(path))
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        with open(save_path, "w", encoding="utf-8") as f:
+            f.write("\n...\n".join(fragments))
+        print(f"Saved fragments: {save_path}")
+        return save_path
+    except Exception as e:
+        print(f"Error: {e}")
+        print(f"Failed to save fragments for {path}")
+        return None
+
+
+def archive_key(item):
+    ref = item["html_url"].split("/blob/", 1)[1].split("/", 1)[0]
+    return item["repository"]["full_name"], ref
+
+
+def group_by_repository(items):
+    groups = {}
+    for item in items:
+        groups.setdefault(archive_key(item), []).append(item["path"])
+    return groups
+
+
+def download_repo_archive(full_name, ref, paths, token=None, download_dir="codes", whole_tree=False, verbose=False):
+    url = GITHUB_ARCHIVE_URL.format(full_name=full_name, ref=ref)
+    wanted = set(paths)
+    extracted = []
+    root = os.path.abspath(download_dir)
+    try:
+        headers = {}
+        if token:
+            headers["Authorization"] = f"token {token}"
+
+        if verbose:
+            print(f"Fetching archive: {url}")
+        with requests.get(url, headers=headers, stream=True) as response:
+            if response.status_code != 200:
+                print(f"Failed to download {url}")
+                return None
+            response.raw.decode_content = True
+            # Stream members straight off the socket; the archive is never held in memory or on disk
+            with tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+                for member in archive:
+                    if not member.isfile() or "/" not in member.name:
+                        continue
+                    path = member.name.split("/", 1)[1]  # Drop the "<owner>-<repo>-<sha>/" prefix
+                    if not whole_tree and path not in wanted:
+                        continue
+                    save_path = os.path.join(download_dir, path)
+                    if not os.path.abspath(save_path).startswith(root + os.sep):
+                        if verbose:
+                            print(f"Skipping unsafe archive member: {member.name}")
+                        continue
+                    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                    with archive.extractfile(member) as src, open(save_path, "wb") as f:
+                        while True:
+                            chunk = src.read(64 * 1024)
+                            if not chunk:
+                                break
+                            f.write(chunk)
+                    print(f"Downloaded: {save_path}")
+                    extracted.append(path)
+                    if not whole_tree and len(extracted) == len(wanted):
+                        break
+        return extracted
+    except Exception as e:
+        print(f"Error: {e}")
+        print(f"Failed to download {url}")
+        return None
@@ -1,31 +1,35 @@
 import google.generativeai as genai
 import dotenv
 import json
+import mmap
 import os
 import subprocess
 import glob
 import sys
+import tracemalloc
 
 dotenv.load_dotenv()
 
-def extract_code_with_gemini(directory_path, remark, verbose=False, file_extensions=None):
-    gemini_api_key = os.getenv("GEMINI_API_KEY")
-    if not gemini_api_key:
-        return "Error: GEMINI_API_KEY not found in environment variables."
+PROMPT_TEMPLATE = """
+    I have the following code files from a project{note}:
     
-    genai.configure(api_key=gemini_api_key)
-    model = genai.GenerativeModel('gemini-1.5-pro')
+    {files}
     
-    if file_extensions is None:
-        file_extensions = ['.py', '.js', '.java', '.c', '.cpp', '.h', '.hpp', '.cs', '.php', '.rb', '.go', '.rs', '.ts']
-    
-    files_content = {}
-    file_count = 0
-    total_size = 0
+    Based on this description: "{remark}", please extract the relevant code sections and provide a cleaned-up, functional version of the code that focuses specifically on what was requested.
     
-    if verbose:
-        print(f"Scanning directory: {directory_path}")
+    Format your response as:
+    ```python
+    # Extracted code here
+    ```
     
+    Include only the code and very necessary comments, no explanations outside the code block.
+    """
+OMITTED_NOTE = " (note: some files were omitted due to size constraints)"
+MAX_FILE_SIZE = 1_000_000  # 1MB
+DEFAULT_EXTENSIONS = ['.py', '.js', '.java', '.c', '.cpp', '.h', '.hpp', '.cs', '.php', '.rb', '.go', '.rs', '.ts']
+
+def _find_code_files(directory_path, file_extensions, verbose=False):
+    candidates = []
     for root, _, files in os.walk(directory_path):
         for file in files:
             file_path = os.path.join(root, file)
@@ -34,87 +38,135 @@ def extract_code_with_gemini(directory_path, remark, verbose=False, file_extensi
                 if verbose:
                     print(f"Skipping non-code file: {file_path}")
                 continue
-                
+            
             try:
                 file_size = os.path.getsize(file_path)
-                if file_size > 1_000_000:  # 1MB
-                    if verbose:
-                        print(f"Skipping large file ({file_size/1_000_000:.2f}MB): {file_path}")
-                    continue
-                    
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    content = f.read()
-                    files_content[file_path] = content
-                    file_count += 1
-                    total_size += len(content)
-                    
-                    if verbose:
-                        print(f"Read file ({len(content)} chars): {file_path}")
-            except Exception as e:
+            except OSError:
+                candidates.append((file_path, None))  # Reported when build_prompt tries to read it
+                continue
+            if file_size > MAX_FILE_SIZE:
                 if verbose:
-                    print(f"Error reading file {file_path}: {e}")
-                files_content[file_path] = f"Error reading file: {e}"
+                    print(f"Skipping large file ({file_size/1_000_000:.2f}MB): {file_path}")
+                continue
+            candidates.append((file_path, file_size))
+    return candidates
+
+def _read_file(file_path, file_size):
+    if file_size is None:
+        file_size = os.path.getsize(file_path)  # Raises the original error again for the error marker
+    if file_size == 0:
+        return ""
+    with open(file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return str(mm, 'utf-8', 'replace')
+
+def build_prompt(directory_path, remark, file_extensions=None, token_limit=30000, verbose=False, exclude=None, copy_counts=None):
+    if file_extensions is None:
+        file_extensions = DEFAULT_EXTENSIONS
     
     if verbose:
-        print(f"Found {file_count} files with total size of {total_size} characters")
+        print(f"Scanning directory: {directory_path}")
     
-    if not files_content:
-        return "No code files found in the specified directory."
+    # Only paths and sizes are collected up front; contents are read one file at a time,
+    # smallest first, and kept only while the prompt stays within the limit.
+    exclude = {os.path.normpath(path) for path in exclude or ()}
+    copy_counts = {os.path.normpath(path): count for path, count in (copy_counts or {}).items()}
+    candidates = sorted(
+        (c for c in _find_code_files(directory_path, file_extensions, verbose) if os.path.normpath(c[0]) not in exclude),
+        key=lambda x: x[1] or 0,
+    )
+    stats = {
+        "files_found": len(candidates),
+        "files_included": 0,
+        "files_skipped": 0,
+        "total_chars": 0,
+        "prompt_chars": 0,
+        "peak_memory_bytes": 0,
+    }
+    if not candidates:
+        return None, stats
     
-    prompt = f"""
-    I have the following code files from a project:
+    # Measures every buffer alive during assembly, including the final join and format
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+        tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
     
-    {json.dumps(files_content, indent=2)}
+    # Size against the longer template so the prompt fits whichever one is used
+    budget = token_limit - len(PROMPT_TEMPLATE.format(note=OMITTED_NOTE, files="{\n\n}", remark=remark))
+    entries = []
+    used = 0
     
-    Based on this description: "{remark}", please extract the relevant code sections and provide a cleaned-up, functional version of the code that focuses specifically on what was requested.
+    for file_path, file_size in candidates:
+        # An encoded entry is never shorter than the file's byte size, so skip without reading
+        if file_size is not None and used + file_size > budget:
+            stats["files_skipped"] += 1
+            if verbose:
+                print(f"Skipping file due to token limit: {file_path}")
+            continue
+        
+        try:
+            content = _read_file(file_path, file_size)
+            if verbose:
+                print(f"Read file ({len(content)} chars): {file_path}")
+        except Exception as e:
+            if verbose:
+                print(f"Error reading file {file_path}: {e}")
+            content = f"Error reading file: {e}"
+        
+        stats["total_chars"] += len(content)
+        copies = copy_counts.get(os.path.normpath(file_path))
+        key = f"{file_path} (representative of {copies} duplicate copies)" if copies else file_path
+        entry = f"  {json.dumps(key)}: {json.dumps(content)}"
+        del content
+        separator = 2 if entries else 0  # ",\n" between entries
+        
+        if used + separator + len(entry) > budget:
+            stats["files_skipped"] += 1
+            if verbose:
+                print(f"Skipping file due to token limit: {file_path}")
+            continue
+        
+        entries.append(entry)
+        used += separator + len(entry)
+        stats["files_included"] += 1
     
-    Format your response as:
-    ```python
-    # Extracted code here
-    ```
+    files = "{\n" + ",\n".join(entries) + "\n}"
+    note = OMITTED_NOTE if stats["files_skipped"] else ""
+    prompt = PROMPT_TEMPLATE.format(note=note, files=files, remark=remark)
+    stats["prompt_chars"] = len(prompt)
+    stats["peak_memory_bytes"] = max(0, tracemalloc.get_traced_memory()[1] - baseline)
+    if started_tracing:
+        tracemalloc.stop()
     
-    Include only the code and very necessary comments, no explanations outside the code block.
-    """
+    if verbose:
+        print(f"Found {stats['files_found']} files, included {stats['files_included']} "
+              f"({stats['total_chars']} characters read, peak {stats['peak_memory_bytes']} bytes in use)")
+    
+    return prompt, stats
+
+def extract_code_with_gemini(directory_path, remark, verbose=False, file_extensions=None, stats=None, exclude=None, copy_counts=None):
+    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    if not gemini_api_key:
+        return "Error: GEMINI_API_KEY not found in environment variables."
+    
+    genai.configure(api_key=gemini_api_key)
+    model = genai.GenerativeModel('gemini-1.5-pro')
+    
+    prompt, prompt_stats = build_prompt(directory_path, remark, file_extensions, verbose=verbose,
+                                        exclude=exclude, copy_counts=copy_counts)
+    if stats is not None:
+        stats.update(prompt_stats)
+    
+    if prompt is None:
+        return "No code files found in the specified directory."
     
     try:
         if verbose:
             print(f"Sending request to Gemini API with {len(prompt)} characters...")
         
-        token_limit = 30000  # Approximate limit for Gemini
-        if len(prompt) > token_limit:
-            if verbose:
-                print(f"Warning: Prompt size ({len(prompt)} chars) exceeds recommended limit. Truncating files...")
-            
-            # More sophisticated truncation strategy - keep most important files
-            important_files = {}
-            current_size = len(prompt) - len(json.dumps(files_content, indent=2))
-            sorted_files = sorted(files_content.items(), key=lambda x: len(x[1]))
-            
-            for file_path, content in sorted_files:
-                file_entry = json.dumps({file_path: content}, indent=2)[1:-1]  # Remove outer braces
-                if current_size + len(file_entry) + 5 < token_limit:  # 5 for commas and formatting
-                    important_files[file_path] = content
-                    current_size += len(file_entry) + 5
-                else:
-                    if verbose:
-                        print(f"Skipping file due to token limit: {file_path}")
-            
-            files_content = important_files
-
-            prompt = f"""
-            I have the following code files from a project (note: some files were omitted due to size constraints):
-            
-            {json.dumps(files_content, indent=2)}
-            
-            Based on this description: "{remark}", please extract the relevant code sections and provide a cleaned-up, functional version of the code that focuses specifically on what was requested.
-            
-            Format your response as:
-            ```python
-            # Extracted code here
-            ```
-            
-            Include only the code and very necessary comments, no explanations outside the code block.
-            """
         response = model.generate_content(prompt)
         content = response.text
         
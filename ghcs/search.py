@@ -1,9 +1,12 @@
 import requests
 
 GITHUB_API_URL = "https://api.github.com/search/code"
+TEXT_MATCH_MEDIA_TYPE = "application/vnd.github.text-match+json"
 
-def search_github(query, user=None, repo=None, language=None, path=None, max_results=None, token=None, verbose=False):
+def search_github(query, user=None, repo=None, language=None, path=None, max_results=None, token=None, verbose=False, text_match=False):
     headers = {"Authorization": f"token {token}"}
+    if text_match:
+        headers["Accept"] = TEXT_MATCH_MEDIA_TYPE
     params = {"q": query}
     
     if user:
@@ -24,4 +27,47 @@ def search_github(query, user=None, repo=None, language=None, path=None, max_res
     results = response.json().get("items", [])
     if verbose:
         print(f"GitHub API returned {len(results)} items.")
-    return results
\ No newline at end of file
+    return results
+
+def extract_fragments(item, context=None):
+    fragments = []
+    for text_match in item.get("text_matches", []):
+        if text_match.get("property") != "content" or not text_match.get("fragment"):
+            continue
+        fragment = text_match["fragment"]
+        if context is not None:
+            fragment = _trim_fragment(fragment, text_match.get("matches", []), context)
+        fragments.append(fragment)
+    return fragments
+
+def _trim_fragment(fragment, matches, context):
+    lines = fragment.splitlines()
+    if not matches:
+        return fragment
+
+    # Map character offsets of each match onto the lines they fall on
+    line_starts = []
+    offset = 0
+    for line in fragment.splitlines(keepends=True):
+        line_starts.append(offset)
+        offset += len(line)
+
+    keep = set()
+    for match in matches:
+        start, end = match.get("indices", [0, 0])
+        for i, line_start in enumerate(line_starts):
+            line_end = line_starts[i + 1] if i + 1 < len(line_starts) else offset
+            if line_start < end and start < line_end:
+                keep.update(range(max(0, i - context), min(len(lines), i + context + 1)))
+
+    if not keep:
+        return fragment
+
+    trimmed = []
+    previous = None
+    for i in sorted(keep):
+        if previous is not None and i != previous + 1:
+            trimmed.append("...")
+        trimmed.append(lines[i])
+        previous = i
+    return "\n".join(trimmed)